@@ -1,9 +1,18 @@
+import re
+
 # --- Configuration Constants ---
 USERS_FILE = "users.json"
 CHAT_HISTORY_DIR = "chat_histories"
+EMBEDDINGS_CACHE_DIR = "emb_cache" # On-disk cache of chunk embeddings
+FAISS_CACHE_DIR = "faiss_cache" # Saved FAISS indexes, one per set of uploaded files
+LLM_CACHE_DB = ".langchain_cache.db" # SQLite cache of LLM responses
+# Bounds on the in-memory caches of vector stores and of the retrievers and
+# chains built on them. A store is only freed once none of them holds it.
+VECTORSTORE_CACHE_SIZE = 8
+VECTORSTORE_CACHE_TTL = 3600 # seconds
 
 # --- Global CSS Styles (Adapted for Dark Theme) ---
-STYLES = """
+_STYLES_SOURCE = """
 <style>
     body {
         font-family: 'Inter', sans-serif;
@@ -115,3 +124,13 @@ STYLES = """
     }
 </style>
 """
+
+def _minify_css(css):
+    """Strips comments and redundant whitespace from a CSS block."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
+
+# Streamlit re-sends this on every rerun (elements that are not re-emitted get
+# removed from the page), so it is minified once here to keep the payload small.
+STYLES = _minify_css(_STYLES_SOURCE)
@@ -1,40 +1,159 @@
 import streamlit as st
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 import io
+import os
+import re
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
 import pandas as pd
 from pypdf import PdfReader
 from pptx import Presentation
 import docx
+import openpyxl # For .xlsx files
 import xlrd # For .xls files
 from bs4 import BeautifulSoup
 
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+# Import constants
+from constants import EMBEDDINGS_CACHE_DIR, FAISS_CACHE_DIR, VECTORSTORE_CACHE_SIZE, VECTORSTORE_CACHE_TTL
+
+# Import utility functions
+from utils import with_script_run_ctx
+
+# --- Chunking Configuration ---
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Texts at least this long are chunked with split_text_fast instead of
+# LangChain's recursive splitter, whose pure-Python scan dominates on large inputs.
+FAST_SPLIT_MIN_CHARS = 1_000_000
+# Sentence ends and paragraph breaks
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+|\n\n+")
+
+# --- Embedding Model Configuration ---
+EMBEDDING_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+# INT8-quantized ONNX export published in the model repository
+ONNX_MODEL_FILE = "onnx/model_quint8_avx2.onnx"
+# Same maximum sequence length sentence-transformers uses for this model
+EMBEDDING_MAX_TOKENS = 256
+
+# --- Vector Index Configuration ---
+# Above this many chunks brute-force search gets slow enough to switch to HNSW
+HNSW_MIN_CHUNKS = 5000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Above this many chunks vectors are stored as int8 in an IVF index (4x less
+# memory than float32); below it there are too few vectors to train the
+# IVF clusters well
+QUANTIZED_MIN_CHUNKS = 50000
+IVF_MAX_LISTS = 4096
+IVF_NPROBE = 16
+
+# PyMuPDF's C text extraction is much faster than pypdf's pure-Python one;
+# pypdf remains the fallback when it is not installed
+try:
+    import pymupdf
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+# BLAKE3 hashes with SIMD and is several times faster than SHA-256; BLAKE2b
+# from the standard library is used when it is not installed
+try:
+    from blake3 import blake3 as _hash_function
+except ImportError:
+    _hash_function = hashlib.blake2b
+
+def _content_hash(data: bytes):
+    """Returns a hex digest of `data`, used as a cache key."""
+    return _hash_function(data).hexdigest()
+
+# selectolax (lexbor backend) parses HTML in C, 20-30x faster than BeautifulSoup's html.parser;
+# BeautifulSoup remains the fallback when it is not installed
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+# ONNX Runtime serves the INT8-quantized export of the embedding model, which runs
+# 2-4x faster on CPU than the FP32 PyTorch model; HuggingFaceEmbeddings is the
+# fallback when it is not installed
+try:
+    import onnxruntime
+    from huggingface_hub import hf_hub_download
+    from transformers import AutoTokenizer
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+# Names the embedding model and settings in use. Prefixes cached chunk vectors
+# and is part of the vector store cache key, so neither is reused across models.
+EMBEDDING_NAMESPACE = "minilm-l6-v2-onnx-int8-" if ONNXRUNTIME_AVAILABLE else "minilm-l6-v2-normalized-"
+
+# torch is installed alongside sentence-transformers; only used to pick a device
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+def _device():
+    """Returns the device the embedding model should run on."""
+    if TORCH_AVAILABLE and torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
 
 # --- File Text Extraction Functions ---
+def _dataframe_to_text(df: pd.DataFrame):
+    """
+    Flattens a DataFrame into a header line plus one line of space-separated
+    cell values per row. Unlike df.to_string(), no column-width padding is built.
+    """
+    header = " ".join(map(str, df.columns))
+    rows = (" ".join(map(str, row)) for row in df.fillna("").itertuples(index=False, name=None))
+    return "\n".join([header, *rows])
+
 def extract_text_from_pdf(pdf_file_content: io.BytesIO):
     """Extracts text from a PDF file."""
-    text = ""
+    parts = []
     try:
-        pdf_reader = PdfReader(pdf_file_content)
-        for page in pdf_reader.pages:
-            text += page.extract_text() or "" # Ensure text is not None
+        if PYMUPDF_AVAILABLE:
+            with pymupdf.open(stream=pdf_file_content.read(), filetype="pdf") as pdf_document:
+                for page in pdf_document:
+                    parts.append(page.get_text())
+        else:
+            pdf_reader = PdfReader(pdf_file_content, strict=False)
+            for page in pdf_reader.pages:
+                parts.append(page.extract_text() or "") # Ensure text is not None
     except Exception as e:
         st.error(f"Error processing PDF: {e}")
-    return text
+    return "".join(parts)
 
 def extract_text_from_ppt(ppt_file_content: io.BytesIO):
     """Extracts text from a PPTX file."""
-    text = ""
+    parts = []
     try:
         presentation = Presentation(ppt_file_content)
         for slide in presentation.slides:
             for shape in slide.shapes:
                 if hasattr(shape, "text"):
-                    text += shape.text + "\n"
+                    parts.append(shape.text + "\n")
     except Exception as e:
         st.error(f"Error processing PPTX: {e}")
-    return text
+    return "".join(parts)
 
 def extract_text_from_py(py_file_content: io.BytesIO):
     """Extracts text from a Python (.py) file."""
@@ -47,33 +166,49 @@ def extract_text_from_py(py_file_content: io.BytesIO):
 
 def extract_text_from_docx(docx_file_content: io.BytesIO):
     """Extracts text from a DOCX file."""
-    text = ""
+    parts = []
     try:
         doc = docx.Document(docx_file_content)
         for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
+            parts.append(paragraph.text + "\n")
     except Exception as e:
         st.error(f"Error processing DOCX: {e}")
-    return text
+    return "".join(parts)
 
-def extract_text_from_excel(excel_file_content: io.BytesIO):
-    """Extracts text from an Excel (.xls or .xlsx) file."""
+def extract_text_from_xlsx(xlsx_file_content: io.BytesIO):
+    """Extracts text from an Excel (.xlsx) file."""
+    parts = []
+    try:
+        # Read-only mode streams rows instead of loading the whole workbook
+        workbook = openpyxl.load_workbook(xlsx_file_content, read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                for row in worksheet.iter_rows(values_only=True):
+                    cells = [str(value) for value in row if value is not None]
+                    if cells:
+                        parts.append(" ".join(cells) + "\n")
+        finally:
+            workbook.close()
+    except Exception as e:
+        st.error(f"Error processing Excel file: {e}")
+    return "".join(parts)
+
+def extract_text_from_xls(xls_file_content: io.BytesIO):
+    """Extracts text from a legacy Excel (.xls) file."""
     text = ""
     try:
-        # Try openpyxl for .xlsx first
+        # on_demand parses one sheet at a time, and each is unloaded once read
+        workbook = xlrd.open_workbook(file_contents=xls_file_content.read(), on_demand=True)
+        parts = []
         try:
-            df = pd.read_excel(excel_file_content, engine='openpyxl')
-            text = df.to_string(index=False)
-        except Exception:
-            # Fallback to xlrd for .xls (older formats)
-            excel_file_content.seek(0) # Reset stream position
-            workbook = xlrd.open_workbook(file_contents=excel_file_content.read())
-            for sheet in workbook.sheets():
-                for row in range(sheet.nrows):
-                    for col in range(sheet.ncols):
-                        cell_value = sheet.cell(row, col).value
-                        if isinstance(cell_value, str):
-                            text += cell_value + " "
+            for sheet_name in workbook.sheet_names():
+                sheet = workbook.sheet_by_name(sheet_name)
+                for row in sheet.get_rows():
+                    parts.extend(cell.value + " " for cell in row if isinstance(cell.value, str))
+                workbook.unload_sheet(sheet_name)
+        finally:
+            workbook.release_resources()
+        text = "".join(parts)
     except Exception as e:
         st.error(f"Error processing Excel file: {e}")
     return text
@@ -83,7 +218,7 @@ def extract_text_from_csv(csv_file_content: io.BytesIO):
     text = ""
     try:
         df = pd.read_csv(csv_file_content)
-        text = df.to_string(index=False)
+        text = _dataframe_to_text(df)
     except Exception as e:
         st.error(f"Error processing CSV: {e}")
     return text
@@ -92,8 +227,15 @@ def extract_text_from_html(html_file_content: io.BytesIO):
     """Extracts text from an HTML file."""
     text = ""
     try:
-        soup = BeautifulSoup(html_file_content.read().decode("utf-8"), 'html.parser')
-        text = soup.get_text(separator=' ', strip=True) # Extract visible text
+        html = html_file_content.read().decode("utf-8", errors="ignore")
+        if SELECTOLAX_AVAILABLE:
+            tree = LexborHTMLParser(html)
+            tree.strip_tags(["script", "style"])
+            root = tree.body or tree.root
+            text = root.text(separator=' ', strip=True) if root else "" # Extract visible text
+        else:
+            soup = BeautifulSoup(html, 'html.parser')
+            text = soup.get_text(separator=' ', strip=True) # Extract visible text
     except Exception as e:
         st.error(f"Error processing HTML: {e}")
     return text
@@ -110,7 +252,8 @@ def extract_text_from_txt(txt_file_content: io.BytesIO):
 def extract_text(file_content: io.BytesIO, file_name: str):
     """
     Generic function to extract text based on file extension.
-    It dispatches to specific extractors.
+    It dispatches to specific extractors. `file_content` can be any seekable
+    binary file-like object, such as a Streamlit UploadedFile.
     """
     text = ""
     file_extension = file_name.split(".")[-1].lower()
@@ -124,8 +267,8 @@ def extract_text(file_content: io.BytesIO, file_name: str):
         "py": extract_text_from_py,
         "doc": extract_text_from_docx, # handles both .doc and .docx
         "docx": extract_text_from_docx,
-        "xls": extract_text_from_excel,
-        "xlsx": extract_text_from_excel,
+        "xls": extract_text_from_xls,
+        "xlsx": extract_text_from_xlsx,
         "csv": extract_text_from_csv,
         "html": extract_text_from_html,
         "txt": extract_text_from_txt,
@@ -138,62 +281,326 @@ def extract_text(file_content: io.BytesIO, file_name: str):
     
     return text
 
+def _extract_uploaded_file(uploaded_file):
+    """Extracts text from a single uploaded file, returning (file name, text)."""
+    try:
+        # UploadedFile is already a BytesIO, so hand it over without copying its buffer
+        uploaded_file.seek(0)
+        return uploaded_file.name, extract_text(uploaded_file, uploaded_file.name)
+    except Exception as e:
+        st.error(f"Could not process {uploaded_file.name}: {e}")
+        return uploaded_file.name, ""
+
+# --- Text Splitting ---
+def split_text_fast(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    """
+    Splits text into chunks of at most `chunk_size` characters on sentence and
+    paragraph boundaries, with consecutive chunks overlapping by up to
+    `chunk_overlap` characters. Sentences longer than `chunk_size` are cut into
+    `chunk_size` pieces.
+    """
+    # Offsets where a sentence starts, plus the end of the text
+    offsets = [0]
+    for match in SENTENCE_BOUNDARY_RE.finditer(text):
+        if match.end() - offsets[-1] > chunk_size:
+            offsets.extend(range(offsets[-1] + chunk_size, match.end(), chunk_size))
+        offsets.append(match.end())
+    if len(text) - offsets[-1] > chunk_size:
+        offsets.extend(range(offsets[-1] + chunk_size, len(text), chunk_size))
+    offsets.append(len(text))
+    bounds = np.unique(np.asarray(offsets, dtype=np.int64))
+
+    # For every boundary, find (vectorized) the furthest boundary that still fits
+    # in one chunk, and the earliest boundary within the overlap window before it.
+    chunk_ends = np.searchsorted(bounds, bounds + chunk_size, side="right") - 1
+    overlap_starts = np.searchsorted(bounds, bounds - chunk_overlap, side="left")
+
+    chunks = []
+    last = len(bounds) - 1
+    start = 0
+    while start < last:
+        end = max(int(chunk_ends[start]), start + 1)
+        chunk = text[bounds[start]:bounds[end]].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= last:
+            break
+        start = max(int(overlap_starts[end]), start + 1)
+    return chunks
+
+# --- Embedding Helpers ---
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with ONNX Runtime from a quantized ONNX export.
+    Mean-pools the token embeddings and L2-normalizes them, which reproduces
+    sentence-transformers' output for all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, model_id: str = EMBEDDING_MODEL_ID, model_file: str = ONNX_MODEL_FILE, batch_size: int = 64):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.session = onnxruntime.InferenceSession(
+            hf_hub_download(model_id, model_file), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.batch_size = batch_size
+
+    def _embed(self, texts):
+        """Embeds texts in batches, returning a float32 matrix of unit-length rows."""
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=EMBEDDING_MAX_TOKENS,
+                return_tensors="np",
+            )
+            inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real (non-padding) tokens, then L2 normalization
+            mask = encoded["attention_mask"][:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            batches.append(pooled.astype(np.float32))
+        return np.concatenate(batches)
+
+    def embed_documents(self, texts):
+        """Embeds a list of documents."""
+        if not texts:
+            return []
+        return self._embed(list(texts)).tolist()
+
+    def embed_query(self, text):
+        """Embeds a single query."""
+        return self._embed([text])[0].tolist()
+
+@st.cache_resource(show_spinner="Loading embedding model...")
+def get_embeddings():
+    """
+    Returns the embedding model used for the knowledge base. Chunk embeddings
+    are cached on disk, so re-uploading the same or overlapping documents skips
+    the model for previously seen chunks; queries are always embedded live.
+    """
+    if ONNXRUNTIME_AVAILABLE:
+        underlying_embeddings = OnnxEmbeddings()
+    else:
+        # Larger batches mean fewer forward passes; vectors come back unit-length.
+        underlying_embeddings = HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_ID,
+            model_kwargs={"device": _device()},
+            encode_kwargs={"batch_size": 128, "normalize_embeddings": True},
+        )
+
+    embedding_store = LocalFileStore(EMBEDDINGS_CACHE_DIR)
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying_embeddings,
+        embedding_store,
+        # The namespace keeps vectors from different models/settings apart
+        key_encoder=lambda text: EMBEDDING_NAMESPACE + _content_hash(text.encode("utf-8")),
+    )
+
+def _embed_by_length(embeddings, texts):
+    """
+    Embeds texts in order of increasing length so each batch pads to a similar
+    size, then returns a C-contiguous float32 matrix whose rows follow the
+    original order of `texts`.
+    """
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    sorted_vectors = np.asarray(embeddings.embed_documents([texts[i] for i in order]), dtype=np.float32)
+
+    vectors = np.empty_like(sorted_vectors)
+    vectors[order] = sorted_vectors
+    return vectors
+
+def _embed_chunks(embeddings, texts):
+    """
+    Embeds chunk texts, computing each distinct text only once. Overlapping
+    chunks and re-uploaded documents often produce identical chunks; every
+    position still gets its own row in the returned matrix.
+    """
+    unique_positions = {}
+    unique_texts = []
+    index_map = []
+    for text in texts:
+        position = unique_positions.get(text)
+        if position is None:
+            position = unique_positions[text] = len(unique_texts)
+            unique_texts.append(text)
+        index_map.append(position)
+
+    unique_vectors = _embed_by_length(embeddings, unique_texts)
+    if len(unique_texts) == len(texts):
+        return unique_vectors
+    return unique_vectors[np.asarray(index_map, dtype=np.intp)]
+
+def _build_vectorstore(splits, vectors, embeddings):
+    """
+    Adds precomputed chunk vectors (a float32 matrix) straight to a FAISS index
+    and wraps it in a LangChain vector store. Small knowledge bases use an exact
+    flat index, large ones an HNSW graph index, and very large ones an IVF index
+    with 8-bit scalar-quantized vectors. The vectors are unit-length, so inner
+    product is cosine similarity.
+    """
+    num_vectors, dimension = vectors.shape
+    if num_vectors <= HNSW_MIN_CHUNKS:
+        index = faiss.IndexFlatIP(dimension)
+        index.add(vectors)
+    elif num_vectors > QUANTIZED_MIN_CHUNKS:
+        nlist = min(IVF_MAX_LISTS, 4 * int(np.sqrt(num_vectors)))
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFScalarQuantizer(
+            quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(vectors)
+        index.add(vectors)
+        index.nprobe = IVF_NPROBE
+    else:
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.add(vectors)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    docstore = InMemoryDocstore({str(i): split for i, split in enumerate(splits)})
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id={i: str(i) for i in range(len(splits))},
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+# --- Vector Store Persistence ---
+def _vectorstore_cache_dir(uploaded_files_list):
+    """
+    Returns the cache directory for a set of uploaded files, keyed by their
+    content and by the embedding model, chunking and index settings used to
+    build the vector store, so changing any of them builds a new one.
+    """
+    settings = repr((
+        EMBEDDING_NAMESPACE, CHUNK_SIZE, CHUNK_OVERLAP, FAST_SPLIT_MIN_CHARS,
+        HNSW_MIN_CHUNKS, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH,
+        QUANTIZED_MIN_CHUNKS, IVF_MAX_LISTS, IVF_NPROBE,
+    ))
+    file_digests = sorted(_content_hash(f.getbuffer()) for f in uploaded_files_list)
+    cache_key = _content_hash((settings + "".join(file_digests)).encode("utf-8"))[:16]
+    return os.path.join(FAISS_CACHE_DIR, cache_key)
+
+def _load_cached_vectorstore(cache_dir):
+    """Loads a previously saved vector store and its document names, or returns (None, [])."""
+    if not os.path.isdir(cache_dir):
+        return None, []
+    try:
+        # The index files were written by this app, so unpickling them is safe
+        vectorstore = FAISS.load_local(
+            cache_dir,
+            get_embeddings(),
+            allow_dangerous_deserialization=True,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+        with open(os.path.join(cache_dir, "doc_names.json"), "r") as f:
+            doc_names = json.load(f)
+        return vectorstore, doc_names
+    except Exception as e:
+        # A partial or incompatible cache entry; it gets rebuilt and overwritten
+        print(f"Warning: Could not load cached vector store from '{cache_dir}': {e}")
+        return None, []
+
+def _save_vectorstore(vectorstore, doc_names, cache_dir):
+    """Saves a vector store and its document names so later sessions can reload it."""
+    try:
+        vectorstore.save_local(cache_dir)
+        with open(os.path.join(cache_dir, "doc_names.json"), "w") as f:
+            json.dump(doc_names, f)
+    except Exception as e:
+        print(f"Warning: Could not save vector store to '{cache_dir}': {e}")
+
 # --- Document Processing and Vector Store Creation ---
-@st.cache_resource(show_spinner="Processing documents and building knowledge base...")
-def process_files_and_create_vectorstore(uploaded_files_list):
+def _uploaded_file_hash(uploaded_file):
+    """Hashes an uploaded file by its bytes, so re-uploads of the same file hit the cache."""
+    return _content_hash(uploaded_file.getbuffer())
+
+class NoContentError(Exception):
+    """Raised when the uploaded files yield nothing to index."""
+
+@st.cache_resource(
+    show_spinner=False, hash_funcs={UploadedFile: _uploaded_file_hash},
+    max_entries=VECTORSTORE_CACHE_SIZE, ttl=VECTORSTORE_CACHE_TTL,
+)
+def _build_vectorstore_cached(uploaded_files_list):
     """
-    Processes a list of uploaded files, extracts text, splits it into chunks,
-    and creates a FAISS vector store.
+    Extracts, splits and embeds the uploaded files into a FAISS vector store.
+    Returns (vectorstore, doc_names). Cached in memory by file contents, and
+    saved to disk under the same key, so the same files are only indexed once
+    and an entry dropped from memory is reloaded from disk.
+    Failures raise rather than return, as st.cache_resource does not keep
+    exceptions and retrying the same files must run again.
     """
-    full_raw_text = ""
+    cache_dir = _vectorstore_cache_dir(uploaded_files_list)
+    vectorstore, doc_names = _load_cached_vectorstore(cache_dir)
+    if vectorstore is not None:
+        return vectorstore, doc_names
+
+    extracted_texts = []
     doc_names = []
 
-    # Iterate through each uploaded file to extract text
-    for uploaded_file in uploaded_files_list:
-        file_content = uploaded_file.getvalue()
-        try:
-            temp_bytes_io = io.BytesIO(file_content)
-            extracted_content = extract_text(temp_bytes_io, uploaded_file.name)
-            if extracted_content:
-                full_raw_text += extracted_content + "\n\n--- Document Separator ---\n\n"
-                doc_names.append(uploaded_file.name)
-        except Exception as e:
-            st.error(f"Could not process {uploaded_file.name}: {e}")
+    # Extract text from the uploaded files concurrently. The parsers spend most
+    # of their time in C extensions and I/O, so threads overlap well here.
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(uploaded_files_list)))) as executor:
+        results = list(executor.map(with_script_run_ctx(_extract_uploaded_file), uploaded_files_list))
+
+    # Results come back in upload order
+    for file_name, extracted_content in results:
+        if extracted_content.strip():
+            extracted_texts.append(extracted_content)
+            doc_names.append(file_name)
 
     # Check if any text was extracted
-    if not full_raw_text.strip():
-        st.warning("No readable content was extracted from the uploaded files.")
-        st.session_state.uploaded_doc_names = []
-        st.session_state.full_document_content = ""
-        return None
-
-    # Initialize text splitter
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    
-    # Create document chunks. The metadata helps in identifying sources later.
-    splits = text_splitter.create_documents(
-        [full_raw_text],
-        metadatas=[{"source": ", ".join(doc_names) if doc_names else "Uploaded Documents"}]
-    )
+    if not extracted_texts:
+        raise NoContentError("No readable content was extracted from the uploaded files.")
+
+    # Split each document on its own so every chunk is tagged with the file it
+    # came from. The metadata helps in identifying sources later.
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    splits = []
+    for doc_name, extracted_content in zip(doc_names, extracted_texts):
+        if len(extracted_content) >= FAST_SPLIT_MIN_CHARS:
+            splits.extend(
+                Document(page_content=chunk, metadata={"source": doc_name})
+                for chunk in split_text_fast(extracted_content)
+            )
+        else:
+            splits.extend(text_splitter.create_documents([extracted_content], metadatas=[{"source": doc_name}]))
 
     # Check if text splitting produced any chunks
     if not splits:
-        st.warning("No text chunks could be generated from the documents.")
-        st.session_state.uploaded_doc_names = []
-        st.session_state.full_document_content = ""
-        return None
+        raise NoContentError("No text chunks could be generated from the documents.")
+
+    # Create embeddings and build the FAISS vector store
+    embeddings = get_embeddings()
+    vectors = _embed_chunks(embeddings, [split.page_content for split in splits])
+    vectorstore = _build_vectorstore(splits, vectors, embeddings)
+    _save_vectorstore(vectorstore, doc_names, cache_dir)
+    return vectorstore, doc_names
 
+def process_files_and_create_vectorstore(uploaded_files_list):
+    """
+    Processes a list of uploaded files, extracts text, splits it into chunks,
+    and creates a FAISS vector store. Returns (vectorstore, doc_names, chunks),
+    with vectorstore None on failure. Runs on a worker thread, so session state
+    is left to the caller: a rerun can abandon this call, and its results must
+    not land in the session afterwards.
+    """
     try:
-        # Create embeddings and build the FAISS vector store
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectorstore = FAISS.from_documents(splits, embeddings)
-        
-        # Store relevant information in session state for later use
-        st.session_state.uploaded_doc_names = doc_names
-        st.session_state.full_document_content = full_raw_text
-        st.session_state.document_chunks = splits
-        
-        return vectorstore
+        vectorstore, doc_names = _build_vectorstore_cached(uploaded_files_list)
+    except NoContentError as e:
+        st.warning(str(e))
+        vectorstore, doc_names = None, []
     except Exception as e:
         st.error(f"Error creating vector store: {e}")
-        return None
+        vectorstore, doc_names = None, []
+
+    chunks = [] if vectorstore is None else [
+        vectorstore.docstore.search(doc_id) for doc_id in vectorstore.index_to_docstore_id.values()
+    ]
+    return vectorstore, doc_names, chunks
@@ -1,9 +1,8 @@
 import streamlit as st
-import os
 from dotenv import load_dotenv
 
 # Import constants
-from constants import USERS_FILE, CHAT_HISTORY_DIR, STYLES
+from constants import USERS_FILE, STYLES
 
 # Import utility functions
 from utils import initialize_session_state, logout
@@ -16,9 +15,6 @@ load_dotenv()
 
 # --- Configuration & Setup ---
 
-# Ensure chat history directory exists
-os.makedirs(CHAT_HISTORY_DIR, exist_ok=True)
-
 # Streamlit UI Setup
 st.set_page_config(page_title="LegalEase AI", layout="wide")
 
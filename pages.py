@@ -1,5 +1,8 @@
 import streamlit as st
+import re
+import textwrap
 import time
+from concurrent.futures import ThreadPoolExecutor
 from deep_translator import GoogleTranslator
 
 # Langchain related imports
@@ -9,19 +12,255 @@ from langchain_groq import ChatGroq
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains import create_history_aware_retriever
-from langchain_core.runnables import RunnableWithMessageHistory
+from langchain_core.runnables import RunnableWithMessageHistory, RunnableGenerator
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration
+from langchain_core.load import dumps
+from langchain_community.vectorstores import FAISS
+from langchain_core.globals import set_llm_cache, get_llm_cache
+from langchain_community.cache import SQLiteCache
 
 # Import utility functions from the utils module
 from utils import (
     add_user, verify_user, clear_chat_history, logout,
-    load_user_chat_history, get_session_history_wrapper, perform_web_search,
-    save_user_chat_history, # Added this import
+    load_display_messages, touch_display_session, list_user_sessions, get_session_history_wrapper, perform_web_search,
+    queue_history_save, with_script_run_ctx,
     GOOGLE_SEARCH_AVAILABLE # Import the global variable to check search availability
 )
 
 # Import document processing functions from the document_processor module
 from document_processor import process_files_and_create_vectorstore
 
+# Import constants
+from constants import LLM_CACHE_DB, VECTORSTORE_CACHE_SIZE, VECTORSTORE_CACHE_TTL
+
+# Cache LLM responses on disk so repeated questions over the same documents skip
+# the Groq API call. Modules are imported once per process, so this runs once.
+set_llm_cache(SQLiteCache(database_path=LLM_CACHE_DB))
+
+# Document processing runs off the script thread so the page can report progress
+PROCESS_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="doc-processing")
+
+
+# --- Prompt Templates ---
+# Contextualize question prompt
+CONTEXTUALIZE_Q_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Given a chat history and the latest user question which might reference context in the chat history, formulate a standalone question which can be understood without the chat history. Do NOT answer the question, just reformulate it if needed and otherwise return it as is."),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+# RAG prompt. Indentation and surrounding whitespace are normalized so
+# that reformatting the source does not change LLM cache keys.
+SYSTEM_PROMPT = textwrap.dedent("""
+You are a knowledge-based AI assistant specializing in providing comprehensive and accurate answers based solely on the provided context. Follow these guidelines:
+
+1. Strictly adhere to the provided context: Do not use any outside knowledge. If the answer isn't in the context, state "I don't have enough information to answer that based on the provided documents."
+2. Provide detailed and exhaustive answers: When the context permits, elaborate on the topic, explaining concepts thoroughly and providing relevant specifics.
+3. Structure your responses clearly: Use headings, bullet points, or numbered lists when appropriate to make the information easy to read and understand.
+4. Maintain accuracy and logical coherence: Ensure all parts of your answer are factually correct according to the context and flow logically.
+5. Prioritize answering the user's direct question: While being detailed, ensure the core of your response directly addresses the user's query.
+6. Answer in {response_language}. The sentence from guideline 1 is the only exception and must always be given exactly as written, in English.
+
+Context:
+{context}
+""").strip()
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+
+# Phrases in a RAG answer that mean the documents did not cover the question,
+# matched in a single case-insensitive pass
+FALLBACK_RE = re.compile(
+    r"not in the document|does not contain|no relevant information|"
+    r"i don't have enough information|cannot answer that|i do not have the required data",
+    re.IGNORECASE,
+)
+
+
+# Stored message type -> (chat_message role, avatar) for rendering history
+ROLE_MAP = {"human": ("user", "👤"), "ai": ("assistant", "🤖")}
+DEFAULT_ROLE = ROLE_MAP["ai"]
+
+
+# Response languages offered in the sidebar
+LANGUAGES = ("English", "Spanish", "French", "German", "Chinese", "Japanese", "Korean", "Arabic", "Russian", "Portuguese", "Italian", "Hindi", "Bengali", "Tamil", "Telugu")
+LANG_INDEX = {language: i for i, language in enumerate(LANGUAGES)}
+
+
+# --- Cached Resources ---
+@st.cache_resource(show_spinner=False)
+def get_llm(api_key: str, model: str = "gemma2-9b-it", temperature: float = 0.2):
+    """
+    Returns a ChatGroq client, shared across reruns for the same settings so its
+    HTTP connection pool is reused instead of rebuilt on every interaction.
+    """
+    return ChatGroq(groq_api_key=api_key, model=model, temperature=temperature)
+
+# GoogleTranslator rejects texts longer than this many characters
+TRANSLATE_MAX_CHARS = 5000
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def cached_translation(text: str, target: str, _translation=None) -> str:
+    """
+    Per-paragraph translation cache, so paragraphs seen before (e.g. stock
+    phrases) are not sent again. Called without _translation it only looks a
+    paragraph up and raises KeyError on a miss, which is not cached; called
+    with it, it stores that translation. _translation is not part of the key.
+    """
+    if _translation is None:
+        raise KeyError(text)
+    return _translation
+
+def _translation_batches(paragraphs):
+    """Groups paragraphs into runs whose joined length stays within TRANSLATE_MAX_CHARS."""
+    batch, size = [], 0
+    for paragraph in paragraphs:
+        if batch and size + 2 + len(paragraph) > TRANSLATE_MAX_CHARS:
+            yield batch
+            batch, size = [], 0
+        size += len(paragraph) + (2 if batch else 0)
+        batch.append(paragraph)
+    if batch:
+        yield batch
+
+def _translate_batch(paragraphs, target):
+    """
+    Translates paragraphs in a single request, joined by blank lines. If the
+    translation does not split back into as many paragraphs, they are sent
+    one at a time instead.
+    """
+    # Built per call: a GoogleTranslator keeps each request's parameters on the
+    # instance, so one shared across browser sessions (threads) could return
+    # another session's text. Construction only validates the language codes.
+    translator = GoogleTranslator(source='auto', target=target)
+    translated = translator.translate("\n\n".join(paragraphs)).split("\n\n")
+    if len(translated) != len(paragraphs):
+        translated = [translator.translate(paragraph) for paragraph in paragraphs]
+    return translated
+
+def translate_text(text: str, language: str) -> str:
+    """
+    Translates markdown text paragraph by paragraph. Cached paragraphs are
+    reused; the rest are sent together in as few requests as the translator's
+    size limit allows, then cached one by one.
+    """
+    target = language.lower()
+    paragraphs = text.split("\n\n")
+    translations = {}
+    uncached = []
+    for paragraph in dict.fromkeys(paragraph for paragraph in paragraphs if paragraph.strip()):
+        try:
+            translations[paragraph] = cached_translation(paragraph, target)
+        except KeyError:
+            uncached.append(paragraph)
+
+    for batch in _translation_batches(uncached):
+        for paragraph, translated in zip(batch, _translate_batch(batch, target)):
+            translations[paragraph] = cached_translation(paragraph, target, translated)
+    return "\n\n".join(translations.get(paragraph, paragraph) for paragraph in paragraphs)
+
+@st.cache_resource(show_spinner=False, hash_funcs={FAISS: id}, max_entries=VECTORSTORE_CACHE_SIZE, ttl=VECTORSTORE_CACHE_TTL)
+def get_retriever(vectorstore):
+    """Returns the similarity retriever for a vector store, shared by every chain built on it."""
+    return vectorstore.as_retriever(search_kwargs={"k": 4})
+
+def cache_backed_stream(llm):
+    """
+    Wraps a chat model so streamed calls go through the global LLM cache.
+    `.stream()` never consults the cache, so the lookup and write-back are done
+    here with the same keys the invoke path uses. A hit is yielded as one chunk.
+    """
+    def transform(prompt_values):
+        messages = None
+        for prompt_value in prompt_values:
+            messages = prompt_value.to_messages()
+
+        cache = get_llm_cache()
+        prompt_key = dumps(messages)
+        llm_string = llm._get_llm_string()
+        cached = cache.lookup(prompt_key, llm_string) if cache else None
+        if cached:
+            yield AIMessageChunk(content=cached[0].message.content)
+            return
+
+        answer = None
+        for chunk in llm.stream(messages):
+            answer = chunk if answer is None else answer + chunk
+            yield chunk
+        if cache and answer is not None:
+            cache.update(prompt_key, llm_string, [ChatGeneration(message=AIMessage(content=answer.content))])
+
+    return RunnableGenerator(transform)
+
+@st.cache_resource(
+    show_spinner=False, hash_funcs={ChatGroq: id, FAISS: id},
+    max_entries=VECTORSTORE_CACHE_SIZE, ttl=VECTORSTORE_CACHE_TTL,
+)
+def build_rag_chain(llm, vectorstore):
+    """
+    Builds the conversational RAG chain for an LLM and vector store. Cached, so
+    the retrievers and chain graph are built once rather than on every message.
+    Both arguments are hashed by identity; the cached chain keeps them alive,
+    so their ids cannot be reused while the entry exists.
+    """
+    history_aware_retriever = create_history_aware_retriever(llm, get_retriever(vectorstore), CONTEXTUALIZE_Q_PROMPT)
+
+    # The answer step is streamed, so it needs the cache-aware wrapper
+    combine_docs_chain = create_stuff_documents_chain(cache_backed_stream(llm), QA_PROMPT)
+    rag_chain = create_retrieval_chain(history_aware_retriever, combine_docs_chain)
+
+    # Runnable with message history
+    return RunnableWithMessageHistory(
+        rag_chain,
+        get_session_history_wrapper, # Function to load/get history
+        input_messages_key="input",
+        history_messages_key="chat_history",
+        output_messages_key="answer",
+    )
+
+
+# --- Chat Turn Helpers ---
+def render_sources(context_docs):
+    """Renders the distinct source documents behind a RAG answer, if any."""
+    sources = {src for doc in context_docs if (src := doc.metadata.get("source"))}
+    if not sources:
+        return
+    st.markdown(
+        f'<div class="source-citation"><strong>Sources:</strong> {", ".join(sources)}</div>',
+        unsafe_allow_html=True
+    )
+
+def stream_rag_answer(conversational_rag_chain, prompt, language, session_id, message_placeholder, prefix):
+    """
+    Streams the RAG chain's answer, written in `language`, into
+    `message_placeholder` (after `prefix`) with st.write_stream, which batches
+    token updates to the browser. Returns a dict with the full "answer" and the
+    retrieved "context" documents, which arrive in their own chunk ahead of the
+    answer.
+    """
+    response = {"answer": "", "context": []}
+
+    def answer_tokens():
+        for chunk in conversational_rag_chain.stream(
+            {"input": prompt, "response_language": language},
+            config={"configurable": {"session_id": session_id}} # Pass session ID for history
+        ):
+            if "context" in chunk:
+                response["context"] = chunk["context"]
+            if "answer" in chunk:
+                yield chunk["answer"]
+
+    with message_placeholder.container():
+        st.markdown(prefix)
+        # write_stream returns an empty list rather than a string if nothing was streamed
+        response["answer"] = st.write_stream(answer_tokens()) or ""
+    return response
+
 
 # --- Page Rendering Functions ---
 def introduction_page():
@@ -139,6 +378,131 @@ def signup_page():
                     st.session_state.page = "login"
                     st.rerun() # Redirect to login page
 
+@st.fragment
+def _chat_fragment(llm, vectorstore, session_id):
+    """
+    Renders the chat history and input. Runs as a fragment, so sending a
+    message reruns only the chat area instead of the sidebar and uploader too.
+    """
+    # Load messages for the current session ID
+    messages_key = f"messages_{session_id}"
+    if messages_key not in st.session_state:
+        # The actual chat history for LangChain is handled by get_session_history_wrapper
+        # This 'messages' list is purely for displaying in Streamlit's chat_message UI
+        st.session_state[messages_key] = load_display_messages(st.session_state.username, session_id)
+    touch_display_session(session_id)
+    messages = st.session_state[messages_key]
+
+    st.markdown("<h2>💬 Chat Session</h2>", unsafe_allow_html=True)
+    
+    with st.container():
+        # Display existing messages
+        for message in messages:
+            role, avatar = ROLE_MAP.get(message["role"], DEFAULT_ROLE)
+            with st.chat_message(role, avatar=avatar):
+                st.markdown(message["content"])
+
+    # Handle user input
+    if prompt := st.chat_input("💬 Ask a question about your documents or a general legal query..."):
+        messages.append({"role": "human", "content": prompt})
+        
+        with st.chat_message("user", avatar="👤"):
+            st.markdown(prompt)
+
+        with st.chat_message("assistant", avatar="🤖"):
+            message_placeholder = st.empty()
+            full_response = "⚠ *Gentle reminder: We generally ensure precise information, but do double-check.* \n\n"
+            
+            rag_succeeded = False
+            show_google_search = False
+            
+            try:
+                if vectorstore:
+                    # The chain is built once per (llm, vectorstore) and reused for every message
+                    conversational_rag_chain = build_rag_chain(llm, vectorstore)
+                    
+                    with st.spinner("🤔 Searching documents..."):
+                        response = stream_rag_answer(
+                            conversational_rag_chain, prompt, st.session_state.selected_language,
+                            session_id, message_placeholder, full_response
+                        )
+                    
+                    response_text = response["answer"]
+                    
+                    # Check if RAG indicates no info from documents (fallback triggers).
+                    # The length check is cheapest and catches empty answers, so it goes first;
+                    # strip() is only needed when the raw text is long but may be mostly whitespace.
+                    if len(response_text) < 30 or FALLBACK_RE.search(response_text) or len(response_text.strip()) < 30:
+                        show_google_search = True
+                    else:
+                        # RAG succeeded, display the complete response without the cursor
+                        full_response += response_text
+                        message_placeholder.markdown(full_response)
+                        rag_succeeded = True
+
+                        # The model already answered in the selected language; save the chat history in the background
+                        queue_history_save(st.session_state.username, session_id)
+                        final_response_to_save = full_response
+
+                        # Keep the final response in session state for display
+                        messages.append({"role": "ai", "content": final_response_to_save})
+                        
+                        # Display sources if available
+                        render_sources(response.get("context", []))
+                else:
+                    # If no vectorstore is available, directly fall back to Google Search
+                    show_google_search = True
+
+            except Exception as e:
+                # Catch any other errors during RAG and fall back to Google Search
+                st.error(f"Error in RAG processing: {e}")
+                show_google_search = True
+
+            # Handle web search fallback if RAG didn't succeed or failed
+            if show_google_search and not rag_succeeded:
+                if not GOOGLE_SEARCH_AVAILABLE:
+                    st.warning("Google search functionality is not available. Please install 'googlesearch-python' package.")
+                    error_msg = "Sorry, I couldn't find an answer in documents and web search is not available. Please try rephrasing or uploading more documents."
+                    message_placeholder.markdown(error_msg)
+                    messages.append({"role": "ai", "content": error_msg})
+                else:
+                    with st.spinner("🌐 Searching the web..."):
+                        web_search_results = perform_web_search(prompt)
+
+                    if web_search_results:
+                        title = web_search_results.get("title", "No Title")
+                        snippet = web_search_results.get("snippet", "No snippet available.")
+                        url = web_search_results.get("url", "#")
+                        
+                        fallback_answer_base = f"""
+🌐 No document context matched your query, but here's something from the web:
+
+*Title:* {title}  
+*Snippet:* {snippet}  
+[🔗 View Full Article]({url})
+                        """
+                        
+                        # Translate fallback answer if needed
+                        if st.session_state.selected_language != "English":
+                            try:
+                                translated_fallback = translate_text(fallback_answer_base, st.session_state.selected_language)
+                                final_fallback_answer = translated_fallback
+                            except Exception as translate_e:
+                                st.warning(f"Failed to translate web search fallback to {st.session_state.selected_language}: {translate_e}. Displaying in English.")
+                                final_fallback_answer = fallback_answer_base
+                        else:
+                            final_fallback_answer = fallback_answer_base
+
+                        message_placeholder.markdown(final_fallback_answer)
+                        messages.append({"role": "ai", "content": final_fallback_answer})
+                    else:
+                        error_msg = "Sorry, I couldn't find an answer in documents or via web search. Please try rephrasing or uploading more documents."
+                        message_placeholder.markdown(error_msg)
+                        messages.append({"role": "ai", "content": error_msg})
+
+                # Save the web search response to chat history
+                queue_history_save(st.session_state.username, session_id)
+
 def chatbot_page():
     """Renders the main chatbot interface."""
     st.markdown("<h1>🤖 LegalEase Chatbot</h1>", unsafe_allow_html=True)
@@ -151,7 +515,7 @@ def chatbot_page():
         st.error("⚠ Groq API Key is missing. Please go to Login page to provide it.")
     else:
         try:
-            llm = ChatGroq(groq_api_key=api_key, model="gemma2-9b-it", temperature=0.2)
+            llm = get_llm(api_key)
         except Exception as e:
             st.error(f"Failed to initialize Groq LLM. Check your Groq API Key: {e}")
             llm = None
@@ -167,8 +531,10 @@ def chatbot_page():
         
         st.write("---")
         st.header("🌐 Response Language")
-        languages = ["English", "Spanish", "French", "German", "Chinese", "Japanese", "Korean", "Arabic", "Russian", "Portuguese", "Italian", "Hindi", "Bengali", "Tamil", "Telugu"]
-        st.session_state.selected_language = st.selectbox("Select Response Language", languages, index=0)
+        st.session_state.selected_language = st.selectbox(
+            "Select Response Language", LANGUAGES,
+            index=LANG_INDEX.get(st.session_state.get("selected_language", "English"), 0)
+        )
 
         st.write("---")
         st.header("📄 Document Upload")
@@ -180,7 +546,22 @@ def chatbot_page():
         )
         
         if uploaded_files and len(uploaded_files) > 0 and st.button("Process Documents", use_container_width=True):
-            st.session_state.vectorstore = process_files_and_create_vectorstore(uploaded_files)
+            with st.status("Building knowledge base...") as status:
+                started = time.monotonic()
+                future = PROCESS_POOL.submit(with_script_run_ctx(process_files_and_create_vectorstore), uploaded_files)
+                while not future.done():
+                    status.update(label=f"Building knowledge base... {int(time.monotonic() - started)}s elapsed")
+                    time.sleep(0.5)
+                # Stored here on the script thread; if a rerun interrupts the
+                # loop above, the abandoned result never reaches the session
+                vectorstore, doc_names, chunks = future.result()
+                st.session_state.vectorstore = vectorstore
+                st.session_state.uploaded_doc_names = doc_names
+                st.session_state.document_chunks = chunks
+                if st.session_state.vectorstore:
+                    status.update(label="Knowledge base ready", state="complete")
+                else:
+                    status.update(label="Could not build knowledge base", state="error")
             if st.session_state.vectorstore:
                 st.success(f"✅ Knowledge base built from {len(st.session_state.uploaded_doc_names)} document(s).")
                 st.rerun() # Rerun to refresh the page after document processing
@@ -192,6 +573,9 @@ def chatbot_page():
             
         st.write("---")
         session_id = st.text_input("🆔 Session ID:", value="default_session", key="current_session_id", help="Use different IDs for separate conversations.")
+        saved_sessions = list_user_sessions(st.session_state.username)
+        if saved_sessions:
+            st.caption("Saved sessions: " + ", ".join(saved_sessions[:10]))
         
         if st.button("🗑 Clear Chat History", key="clear_chat_button", use_container_width=True):
             clear_chat_history(session_id) # Calls the clear_chat_history function from utils.py
@@ -200,193 +584,7 @@ def chatbot_page():
 
     # Main chat interface logic
     if llm:
-        # Load messages for the current session ID
-        if f"messages_{session_id}" not in st.session_state:
-            # The actual chat history for LangChain is handled by get_session_history_wrapper
-            # This 'messages' list is purely for displaying in Streamlit's chat_message UI
-            _, messages = load_user_chat_history(st.session_state.username, session_id)
-            st.session_state[f"messages_{session_id}"] = messages
-
-        st.markdown("<h2>💬 Chat Session</h2>", unsafe_allow_html=True)
-        
-        with st.container():
-            # Display existing messages
-            for message in st.session_state[f"messages_{session_id}"]:
-                role = "user" if message["role"] == "human" else "assistant"
-                avatar = "👤" if role == "user" else "🤖"
-                
-                with st.chat_message(role, avatar=avatar):
-                    st.markdown(message["content"])
-
-        # Handle user input
-        if prompt := st.chat_input("💬 Ask a question about your documents or a general legal query..."):
-            st.session_state[f"messages_{session_id}"].append({"role": "human", "content": prompt})
-            
-            with st.chat_message("user", avatar="👤"):
-                st.markdown(prompt)
-
-            with st.chat_message("assistant", avatar="🤖"):
-                message_placeholder = st.empty()
-                full_response = "⚠ *Gentle reminder: We generally ensure precise information, but do double-check.* \n\n"
-                
-                rag_succeeded = False
-                show_google_search = False
-                
-                try:
-                    if vectorstore:
-                        # RAG chain setup
-                        retriever = vectorstore.as_retriever()
-                        
-                        # Contextualize question prompt
-                        contextualize_q_prompt = ChatPromptTemplate.from_messages([
-                            ("system", "Given a chat history and the latest user question which might reference context in the chat history, formulate a standalone question which can be understood without the chat history. Do NOT answer the question, just reformulate it if needed and otherwise return it as is."),
-                            MessagesPlaceholder("chat_history"),
-                            ("human", "{input}"),
-                        ])
-                        history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
-                        
-                        # RAG prompt
-                        system_prompt = """
-                        You are a knowledge-based AI assistant specializing in providing comprehensive and accurate answers based solely on the provided context. Follow these guidelines:
-
-                        1. Strictly adhere to the provided context: Do not use any outside knowledge. If the answer isn't in the context, state "I don't have enough information to answer that based on the provided documents."
-                        2. Provide detailed and exhaustive answers: When the context permits, elaborate on the topic, explaining concepts thoroughly and providing relevant specifics.
-                        3. Structure your responses clearly: Use headings, bullet points, or numbered lists when appropriate to make the information easy to read and understand.
-                        4. Maintain accuracy and logical coherence: Ensure all parts of your answer are factually correct according to the context and flow logically.
-                        5. Prioritize answering the user's direct question: While being detailed, ensure the core of your response directly addresses the user's query.
-
-                        Context:
-                        {context}
-                        """
-                        
-                        qa_prompt = ChatPromptTemplate.from_messages([
-                            ("system", system_prompt),
-                            MessagesPlaceholder("chat_history"),
-                            ("human", "{input}"),
-                        ])
-                        
-                        combine_docs_chain = create_stuff_documents_chain(llm, qa_prompt)
-                        rag_chain = create_retrieval_chain(history_aware_retriever, combine_docs_chain)
-
-                        # Runnable with message history
-                        conversational_rag_chain = RunnableWithMessageHistory(
-                            rag_chain,
-                            get_session_history_wrapper, # Function to load/get history
-                            input_messages_key="input",
-                            history_messages_key="chat_history",
-                        )
-                        
-                        with st.spinner("🤔 Searching documents..."):
-                            response = conversational_rag_chain.invoke(
-                                {"input": prompt},
-                                config={"configurable": {"session_id": session_id}} # Pass session ID for history
-                            )
-                        
-                        response_text = response["answer"]
-                        
-                        # Check if RAG indicates no info from documents (fallback triggers)
-                        rag_fallback_triggers = [
-                            "not in the document", "does not contain", "no relevant information",
-                            "i don't have enough information", "cannot answer that", "i do not have the required data"
-                        ]
-
-                        # Decide whether to show Google Search based on RAG response
-                        if any(phrase in response_text.lower() for phrase in rag_fallback_triggers) or len(response_text.strip()) < 30:
-                            show_google_search = True
-                        else:
-                            # RAG succeeded, display the response character by character
-                            for chunk in response_text.split(" "):
-                                full_response += chunk + " "
-                                message_placeholder.markdown(full_response + "▌")
-                                time.sleep(0.02) # Simulate typing
-                            message_placeholder.markdown(full_response)
-                            rag_succeeded = True
-
-                            # Handle translation if a language other than English is selected
-                            if st.session_state.selected_language != "English":
-                                try:
-                                    translator = GoogleTranslator(source='auto', target=st.session_state.selected_language.lower())
-                                    # Remove initial disclaimer before translation to avoid translating it
-                                    translated_response = translator.translate(full_response.replace("⚠ *Gentle reminder: We generally ensure precise information, but do double-check.* \n\n", "").strip())
-                                    translated_response_with_disclaimer = "⚠ *Gentle reminder: We generally ensure precise information, but do double-check.* \n\n" + translated_response
-                                    message_placeholder.markdown(translated_response_with_disclaimer)
-                                    final_response_to_save = translated_response_with_disclaimer
-                                except Exception as translate_e:
-                                    st.warning(f"Failed to translate to {st.session_state.selected_language}: {translate_e}. Displaying in English.")
-                                    final_response_to_save = full_response
-                            else:
-                                final_response_to_save = full_response
-
-                            # Save the final response (English or translated) to session state and file
-                            st.session_state[f"messages_{session_id}"].append({"role": "ai", "content": final_response_to_save})
-                            save_user_chat_history(st.session_state.username, session_id, get_session_history_wrapper(session_id))
-                            
-                            # Display sources if available
-                            if "context" in response and response["context"]:
-                                sources = set()
-                                for doc in response["context"]:
-                                    if hasattr(doc, 'metadata') and 'source' in doc.metadata:
-                                        sources.add(doc.metadata['source'])
-                                
-                                if sources:
-                                    st.markdown(
-                                        f'<div class="source-citation"><strong>Sources:</strong> {", ".join(sources)}</div>',
-                                        unsafe_allow_html=True
-                                    )
-                    else:
-                        # If no vectorstore is available, directly fall back to Google Search
-                        show_google_search = True
-
-                except Exception as e:
-                    # Catch any other errors during RAG and fall back to Google Search
-                    st.error(f"Error in RAG processing: {e}")
-                    show_google_search = True
-
-                # Handle web search fallback if RAG didn't succeed or failed
-                if show_google_search and not rag_succeeded:
-                    if not GOOGLE_SEARCH_AVAILABLE:
-                        st.warning("Google search functionality is not available. Please install 'googlesearch-python' package.")
-                        error_msg = "Sorry, I couldn't find an answer in documents and web search is not available. Please try rephrasing or uploading more documents."
-                        message_placeholder.markdown(error_msg)
-                        st.session_state[f"messages_{session_id}"].append({"role": "ai", "content": error_msg})
-                    else:
-                        with st.spinner("🌐 Searching the web..."):
-                            web_search_results = perform_web_search(prompt)
-
-                        if web_search_results:
-                            title = web_search_results.get("title", "No Title")
-                            snippet = web_search_results.get("snippet", "No snippet available.")
-                            url = web_search_results.get("url", "#")
-                            
-                            fallback_answer_base = f"""
-🌐 No document context matched your query, but here's something from the web:
-
-*Title:* {title}  
-*Snippet:* {snippet}  
-[🔗 View Full Article]({url})
-                            """
-                            
-                            # Translate fallback answer if needed
-                            if st.session_state.selected_language != "English":
-                                try:
-                                    translator = GoogleTranslator(source='auto', target=st.session_state.selected_language.lower())
-                                    translated_fallback = translator.translate(fallback_answer_base)
-                                    final_fallback_answer = translated_fallback
-                                except Exception as translate_e:
-                                    st.warning(f"Failed to translate web search fallback to {st.session_state.selected_language}: {translate_e}. Displaying in English.")
-                                    final_fallback_answer = fallback_answer_base
-                            else:
-                                final_fallback_answer = fallback_answer_base
-
-                            message_placeholder.markdown(final_fallback_answer)
-                            st.session_state[f"messages_{session_id}"].append({"role": "ai", "content": final_fallback_answer})
-                        else:
-                            error_msg = "Sorry, I couldn't find an answer in documents or via web search. Please try rephrasing or uploading more documents."
-                            message_placeholder.markdown(error_msg)
-                            st.session_state[f"messages_{session_id}"].append({"role": "ai", "content": error_msg})
-
-                    # Save the web search response to chat history
-                    save_user_chat_history(st.session_state.username, session_id, get_session_history_wrapper(session_id))
+        _chat_fragment(llm, vectorstore, session_id)
 
     else:
         # Message displayed when LLM is not initialized (e.g., missing API key)
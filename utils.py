@@ -1,7 +1,15 @@
 import streamlit as st
 import os
 import json
-import time # Imported for potential future use or if needed by perform_web_search later
+import hashlib
+import hmac
+import time
+import threading
+from collections import OrderedDict
+from itertools import islice
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory, HumanMessage, AIMessage # Import both classes
 
@@ -13,120 +21,528 @@ try:
     from googlesearch import search as google_search
     GOOGLE_SEARCH_AVAILABLE = True
 except ImportError:
+    google_search = None
     GOOGLE_SEARCH_AVAILABLE = False
     # No st.warning here, as it's a utility file. warnings will be in pages.py
 
+# orjson (de)serializes chat history lines faster; stdlib json is the fallback
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    _json_loads = json.loads # Accepts bytes too
+
+# --- Threading Helpers ---
+def with_script_run_ctx(func):
+    """
+    Wraps a function so that, when called on a worker thread, it runs with the
+    current Streamlit script context attached. Without it, st.* calls made from
+    the worker (e.g. st.error) are silently dropped.
+    """
+    ctx = get_script_run_ctx()
+
+    def wrapper(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args, **kwargs)
+
+    return wrapper
+
 # --- User Management Functions ---
+# Parsed users.json, keyed by the file's (mtime_ns, size) when it was read
+_users_cache = {"key": None, "data": {}}
+
 def load_users():
-    """Loads user data from the users.json file."""
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            # Handle empty or corrupted file
-            return {}
-    return {}
+    """
+    Loads user data from the users.json file. The parsed data is reused until
+    the file changes on disk, so repeated logins cost a single stat call.
+    """
+    try:
+        stat = os.stat(USERS_FILE)
+    except FileNotFoundError:
+        return {}
+    key = (stat.st_mtime_ns, stat.st_size)
+    if key == _users_cache["key"]:
+        return _users_cache["data"]
+
+    try:
+        with open(USERS_FILE, "r") as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError):
+        # Handle empty or corrupted file
+        return {}
+    _users_cache["key"], _users_cache["data"] = key, data
+    return data
 
 def save_users(users_data):
     """Saves user data to the users.json file."""
     try:
         with open(USERS_FILE, "w") as f:
             json.dump(users_data, f, indent=4)
+        # Keep the cache in step with what was just written
+        stat = os.stat(USERS_FILE)
+        _users_cache["key"], _users_cache["data"] = (stat.st_mtime_ns, stat.st_size), users_data
     except Exception as e:
         st.error(f"Error saving user data: {e}")
 
+# scrypt cost parameters for new password records. Each record stores the
+# parameters it was made with, so raising them still verifies older records.
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+def _password_digest(password, salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Returns the salted scrypt digest stored for a password."""
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=32).hex()
+
+def _hash_password(password):
+    """Returns the stored record for a password: its digest, a fresh random salt and the scrypt parameters."""
+    salt = os.urandom(16)
+    return {
+        "algo": "scrypt", "n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P,
+        "hash": _password_digest(password, salt), "salt": salt.hex(),
+    }
+
+def _password_matches(record, password):
+    """Checks a password against a stored record, including those made by older versions."""
+    if isinstance(record, str):
+        # Plaintext, from before passwords were hashed
+        return hmac.compare_digest(record.encode("utf-8"), password.encode("utf-8"))
+    salt = bytes.fromhex(record["salt"])
+    if record.get("algo") == "scrypt":
+        digest = _password_digest(password, salt, record["n"], record["r"], record["p"])
+    else:
+        # Salted BLAKE2b, used before scrypt
+        digest = hashlib.blake2b(password.encode("utf-8"), salt=salt, digest_size=16).hexdigest()
+    return hmac.compare_digest(record["hash"], digest)
+
+def _needs_rehash(record):
+    """Returns True for records not made with scrypt at the current cost."""
+    return isinstance(record, str) or record.get("algo") != "scrypt" or (
+        (record["n"], record["r"], record["p"]) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    )
+
 def add_user(username, password):
     """Adds a new user to the system."""
     if not username or not password:
         return False, "Username and password cannot be empty."
     
-    users = load_users()
+    # Copy, so a failed save does not leave the new user in the cached data
+    users = dict(load_users())
     if username in users:
         return False, "Username already exists."
     
-    users[username] = password
+    users[username] = _hash_password(password)
     save_users(users)
     return True, "Account created successfully. You can now log in."
 
 def verify_user(username, password):
     """Verifies user credentials."""
-    users = load_users()
-    return username in users and users[username] == password
+    record = load_users().get(username)
+    if record is None:
+        return False
+
+    if not _password_matches(record, password):
+        return False
+
+    if _needs_rehash(record):
+        # Plaintext, BLAKE2b or lower-cost records are upgraded on a successful login
+        users = dict(load_users())
+        users[username] = _hash_password(password)
+        save_users(users)
+    return True
 
 # --- Chat History Management Functions ---
+# (username, session_id) -> chat history file path
+_path_cache: dict[tuple[str, str], str] = {}
+
 def get_chat_history_file_path(username, session_id):
-    """Generates the file path for a user's chat history."""
+    """
+    Generates the file path for a user's chat history. Histories are stored as
+    JSON Lines, one message per line, so new messages can be appended. Paths
+    are memoized, as they are looked up on every load, save and history check.
+    """
+    key = (username, session_id)
+    path = _path_cache.get(key)
+    if path is None:
+        path = _path_cache[key] = os.path.join(CHAT_HISTORY_DIR, username, f"{session_id}.jsonl")
+    return path
+
+# Chat history directories already created by this process
+_ensured_dirs: set[str] = set()
+
+def ensure_chat_history_dir(username):
+    """Creates the user's chat history directory, at most once per process."""
     user_dir = os.path.join(CHAT_HISTORY_DIR, username)
-    os.makedirs(user_dir, exist_ok=True) # Ensure user directory exists
-    return os.path.join(user_dir, f"{session_id}.json")
+    if user_dir not in _ensured_dirs:
+        os.makedirs(user_dir, exist_ok=True)
+        _ensured_dirs.add(user_dir)
+
+def _migrate_legacy_chat_history(username, session_id, file_path):
+    """
+    Converts a history saved by older versions (one JSON array per session in
+    '<session_id>.json') to JSON Lines, then removes the old file. Returns
+    True if a legacy history was migrated.
+    """
+    legacy_path = os.path.join(CHAT_HISTORY_DIR, username, f"{session_id}.json")
+    try:
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            raw_messages = json.load(f)
+        with open(file_path, "wb") as f:
+            # Stream the lines through the file buffer rather than joining them first
+            f.writelines(_json_dumps(msg_data) + b"\n" for msg_data in raw_messages)
+        os.remove(legacy_path)
+        return True
+    except FileNotFoundError:
+        return False
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"Warning: Could not migrate chat history for session '{session_id}': {e}")
+        return False
 
 def load_user_chat_history(username, session_id):
     """Loads chat history for a given user and session."""
     file_path = get_chat_history_file_path(username, session_id)
     chat_history = ChatMessageHistory()
-    messages = []
-    
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, "r") as f:
-                raw_messages = json.load(f)
-                for msg_data in raw_messages:
-                    messages.append({"role": msg_data["type"], "content": msg_data["content"]})
-                    # Reconstruct ChatMessageHistory
-                    if msg_data["type"] == "human":
-                        chat_history.add_user_message(msg_data["content"])
-                    elif msg_data["type"] == "ai":
-                        chat_history.add_ai_message(msg_data["content"])
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            # Handle case where file is empty or corrupted, log to console
-            print(f"Warning: Could not load chat history for session '{session_id}': {e}")
-    
+
+    # Open directly rather than checking for the file first; most sessions being
+    # loaded already have one
+    raw_messages = []
+    try:
+        with open(file_path, "rb") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    raw_messages.append(_json_loads(line))
+                except json.JSONDecodeError as e:
+                    # A torn or corrupted line, e.g. from a crash mid-write. Skip
+                    # it and keep the rest of the history; log to console.
+                    print(f"Warning: Skipping unreadable line {line_number} of chat history for session '{session_id}': {e}")
+    except FileNotFoundError:
+        if _migrate_legacy_chat_history(username, session_id, file_path):
+            return load_user_chat_history(username, session_id)
+        return chat_history, []
+
+    messages = [{"role": msg_data["type"], "content": msg_data["content"]} for msg_data in raw_messages]
+    # Reconstruct ChatMessageHistory
+    add_message = {"human": chat_history.add_user_message, "ai": chat_history.add_ai_message}
+    for msg_data in raw_messages:
+        add = add_message.get(msg_data["type"])
+        if add is not None:
+            add(msg_data["content"])
     return chat_history, messages
 
-def save_user_chat_history(username, session_id, chat_history: BaseChatMessageHistory):
-    """Saves chat history for a given user and session."""
+@st.cache_data(show_spinner=False, max_entries=128)
+def _load_history_cached(username, session_id, file_meta):
+    """
+    Cached display messages for a session. file_meta, the file's (mtime_ns,
+    size), is only part of the cache key: every save changes it, so a stale
+    entry is never returned.
+    """
+    _, messages = load_user_chat_history(username, session_id)
+    return messages
+
+def load_display_messages(username, session_id):
+    """Returns the display messages for a session, skipping disk reads when the file is unchanged."""
+    try:
+        stat = os.stat(get_chat_history_file_path(username, session_id))
+    except FileNotFoundError:
+        # Not cached: a missing file has no (mtime_ns, size) to tell a later
+        # recreated or migrated file apart, and the read is cheap anyway
+        _, messages = load_user_chat_history(username, session_id)
+        return messages
+    return _load_history_cached(username, session_id, (stat.st_mtime_ns, stat.st_size))
+
+# Serializes history appends against change checks, so a session never
+# mistakes its own background writes for messages from another process
+_history_lock = threading.Lock()
+
+# Per (username, session_id): number of messages of the shared history already
+# written to disk, and (mtime_ns, size, bytes read) of its file
+_history_saved_count: dict[tuple[str, str], int] = {}
+_history_meta: dict[tuple[str, str], tuple[int, int, int]] = {}
+# Per (username, session_id): id() of the history object the entries above describe
+_history_ids: dict[tuple[str, str], int] = {}
+
+def _history_file_meta(file_path):
+    """Returns (mtime_ns, size) of a history file, or (0, 0) if it does not exist."""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return 0, 0
+    return stat.st_mtime_ns, stat.st_size
+
+def _read_history_tail(file_path, offset, chat_history):
+    """
+    Adds the messages appended to a history file after byte `offset` to
+    chat_history. Returns (new offset, number of messages added).
+    """
+    added = 0
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break # A write still in progress; read it next time
+            offset += len(line)
+            if not line.strip():
+                continue
+            msg_data = _json_loads(line)
+            if msg_data["type"] == "human":
+                chat_history.add_user_message(_in_memory_content(msg_data["content"]))
+                added += 1
+            elif msg_data["type"] == "ai":
+                chat_history.add_ai_message(_in_memory_content(msg_data["content"]))
+                added += 1
+    return offset, added
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _list_sessions_cached(username, dir_mtime):
+    """Scans a user's chat history directory. dir_mtime is only part of the cache key."""
+    last_modified = {}
+    try:
+        with os.scandir(os.path.join(CHAT_HISTORY_DIR, username)) as entries:
+            for entry in entries:
+                session_id, ext = os.path.splitext(entry.name)
+                if ext in (".jsonl", ".json"):
+                    mtime = entry.stat(follow_symlinks=False).st_mtime
+                    last_modified[session_id] = max(mtime, last_modified.get(session_id, 0))
+    except FileNotFoundError:
+        return []
+    return sorted(last_modified, key=last_modified.get, reverse=True)
+
+def list_user_sessions(username):
+    """
+    Returns the IDs of a user's saved chat sessions, newest first. The
+    directory is only rescanned when a session file is created or removed,
+    so the order reflects activity as of the last such change.
+    """
+    try:
+        dir_mtime = os.stat(os.path.join(CHAT_HISTORY_DIR, username)).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    return _list_sessions_cached(username, dir_mtime)
+
+def _encode_msg(msg_type, content):
+    """
+    Encodes one history line. Every line has the same two keys, so only the
+    values go through the JSON encoder.
+    """
+    return b'{"type":' + _json_dumps(msg_type) + b',"content":' + _json_dumps(content) + b'}\n'
+
+def save_user_chat_history(username, session_id, new_messages):
+    """
+    Appends new messages to a session's chat history file, so each save costs
+    O(new messages) instead of rewriting the whole conversation.
+    """
+    if not new_messages:
+        return
     try:
+        ensure_chat_history_dir(username)
         file_path = get_chat_history_file_path(username, session_id)
-        # Convert messages to a serializable format (list of dicts)
-        serializable_messages = [{"type": msg.type, "content": msg.content} for msg in chat_history.messages]
-        with open(file_path, "w") as f:
-            json.dump(serializable_messages, f, indent=4)
+        lines = b"".join(_encode_msg(msg.type, msg.content) for msg in new_messages)
+        with _history_lock:
+            # Written in one call, so the batch is flushed with a single write
+            with open(file_path, "ab+") as f:
+                write_offset = f.seek(0, os.SEEK_END)
+                if write_offset:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # A torn last line; end it so the batch starts on a line of its own
+                        lines = b"\n" + lines
+                f.write(lines)
+            # These messages are already in memory. If nothing else touched the
+            # file, move the read offset past them; otherwise reload it in full.
+            key = (username, session_id)
+            meta = _history_meta.get(key)
+            if meta is not None and meta[2] == write_offset:
+                mtime_ns, size = _history_file_meta(file_path)
+                _history_meta[key] = (mtime_ns, size, size)
+            else:
+                _history_meta.pop(key, None)
     except Exception as e:
         st.error(f"Error saving chat history: {e}")
 
+# Chat history is written on a background thread so the UI does not wait on
+# disk. A single worker keeps each session's appends in order; pending writes
+# are flushed when the process exits.
+SAVE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-save")
+atexit.register(SAVE_POOL.shutdown, wait=True)
+
+def take_unsaved_chat_messages(session_id):
+    """
+    Returns the messages added to a session's history since it was last saved,
+    and marks them as saved.
+    """
+    chat_history = get_session_history_wrapper(session_id)
+    key = (st.session_state.username, session_id)
+    with _history_lock:
+        saved_count = _history_saved_count.get(key, 0)
+        _history_saved_count[key] = len(chat_history.messages)
+    return chat_history.messages[saved_count:]
+
+def queue_history_save(username, session_id):
+    """
+    Queues the session's unsaved chat messages to be appended on the
+    background writer. Called once at the end of each chat turn, so a turn's
+    messages go to disk in a single write.
+    """
+    new_messages = take_unsaved_chat_messages(session_id)
+    if new_messages:
+        SAVE_POOL.submit(with_script_run_ctx(save_user_chat_history), username, session_id, new_messages)
+
+def flush_history_saves():
+    """Waits until every queued chat history write has reached the file."""
+    # The single worker runs tasks in order, so this finishes after all earlier ones
+    SAVE_POOL.submit(lambda: None).result()
+
+# Messages longer than this, or inline images, are kept on disk only. The
+# in-memory history (and so every LLM prompt) holds a short placeholder;
+# display messages are read from the file and show them in full.
+ATTACHMENT_MAX_CHARS = 32_768
+
+def _is_attachment(content):
+    """Returns True for message contents too large or too opaque to keep in memory."""
+    return isinstance(content, str) and (len(content) > ATTACHMENT_MAX_CHARS or content.startswith("data:image"))
+
+def _in_memory_content(content):
+    """Returns the content to keep in the in-memory history for a message read from disk."""
+    if not _is_attachment(content):
+        return content
+    if content.startswith("data:image"):
+        return "[image attachment]"
+    return f"[attachment of {len(content)} characters]"
+
+def _stash_attachments(chat_history):
+    """Replaces oversized or inline-image messages in a freshly loaded history with placeholders."""
+    for msg in chat_history.messages:
+        msg.content = _in_memory_content(msg.content)
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _get_or_load(username, session_id, _pinned=None):
+    """
+    Loads a session's ChatMessageHistory from disk. Cached, so every rerun and
+    browser tab of the same user and session shares a single history object.
+    _pinned is the history the calling browser session already holds; it is
+    not part of the cache key.
+    """
+    key = (username, session_id)
+    if _pinned is not None and _history_ids.get(key) == id(_pinned):
+        # The entry was evicted while a browser session still held it. It may
+        # have messages not saved yet, so keep it instead of reloading from disk.
+        return _pinned
+
+    chat_history, _ = load_user_chat_history(username, session_id)
+    _stash_attachments(chat_history)
+    _history_ids[key] = id(chat_history)
+    # Everything loaded from disk is already persisted. Stat after loading,
+    # as loading may have migrated a legacy file.
+    _history_saved_count[key] = len(chat_history.messages)
+    mtime_ns, size = _history_file_meta(get_chat_history_file_path(username, session_id))
+    _history_meta[key] = (mtime_ns, size, size)
+    return chat_history
+
+def _forget_chat_history(username, session_id):
+    """Drops the cached history and file bookkeeping of a session."""
+    _get_or_load.clear(username, session_id)
+    _history_saved_count.pop((username, session_id), None)
+    _history_meta.pop((username, session_id), None)
+    _history_ids.pop((username, session_id), None)
+
+def _sync_chat_history(username, session_id, chat_history):
+    """
+    Brings a fully saved history up to date with its file: reads lines
+    appended by another process, or reloads it if the file was truncated,
+    removed or unreadable. Returns the history to use. Call with _history_lock held.
+    """
+    key = (username, session_id)
+    file_path = get_chat_history_file_path(username, session_id)
+    meta = _history_meta.get(key)
+    mtime_ns, size = _history_file_meta(file_path)
+
+    if meta is not None and mtime_ns != meta[0] and size > meta[2]:
+        try:
+            consumed, added = _read_history_tail(file_path, meta[2], chat_history)
+            # Messages read from disk are already persisted
+            _history_saved_count[key] = _history_saved_count.get(key, 0) + added
+            _history_meta[key] = (mtime_ns, size, consumed)
+        except (json.JSONDecodeError, KeyError, OSError) as e:
+            print(f"Warning: Could not read new chat history for session '{session_id}': {e}")
+            meta = None
+    elif meta is not None and size < meta[2]:
+        # The file was truncated or removed elsewhere
+        meta = None
+
+    if meta is None:
+        _forget_chat_history(username, session_id)
+        chat_history = _get_or_load(username, session_id)
+    return chat_history
+
 def get_session_history_wrapper(session_id: str) -> BaseChatMessageHistory:
-    """Wrapper function to get or create chat history for RunnableWithMessageHistory."""
+    """
+    Wrapper function to get or create chat history for RunnableWithMessageHistory.
+    The history is loaded once per (user, session_id); afterwards the file is
+    only stat'ed, and messages appended by another process are read from the
+    end of the file.
+    """
     # Ensure username is available in session state
-    if st.session_state.username is None:
+    username = st.session_state.username
+    if username is None:
         return ChatMessageHistory() # Return an empty history if no user is logged in
-    
-    # Load history only once per session_id
-    if session_id not in st.session_state.store:
-        st.session_state.store[session_id], _ = load_user_chat_history(st.session_state.username, session_id)
-    return st.session_state.store[session_id]
+
+    key = (username, session_id)
+    histories = st.session_state.chat_histories
+    with _history_lock:
+        chat_history = _get_or_load(username, session_id, histories.get(session_id))
+        # While a turn's messages are unsaved, lines appended elsewhere would
+        # land after them and shift the saved count, and a reload would drop
+        # them. Both wait until the turn is saved; its append then finds the
+        # other lines and forces a reload in file order.
+        if _history_saved_count.get(key, 0) == len(chat_history.messages):
+            chat_history = _sync_chat_history(username, session_id, chat_history)
+    # Held per browser session, so an eviction from _get_or_load between adding
+    # a turn's messages and saving them cannot drop them
+    histories[session_id] = chat_history
+    return chat_history
 
 def clear_chat_history(session_id):
     """Clears chat history for a specific session for the current user."""
+    # A write still queued would otherwise recreate the file after it is removed
+    flush_history_saves()
+
     if f"messages_{session_id}" in st.session_state:
         del st.session_state[f"messages_{session_id}"]
+    st.session_state.chat_histories.pop(session_id, None)
     
-    if session_id in st.session_state.store:
-        del st.session_state.store[session_id]
+    with _history_lock:
+        _forget_chat_history(st.session_state.username, session_id)
     
     # Also delete the physical file
     history_file = get_chat_history_file_path(st.session_state.username, session_id)
-    if os.path.exists(history_file):
+    try:
         os.remove(history_file)
+    except FileNotFoundError:
+        pass
+    _path_cache.pop((st.session_state.username, session_id), None)
     
     st.success(f"Chat history for session '{session_id}' cleared.")
     st.rerun()
 
 def logout():
     """Logs out the user and resets relevant session state variables."""
+    # Let queued writes finish before the user's history bookkeeping is dropped
+    flush_history_saves()
+    username = st.session_state.get("username")
     keys_to_reset = [
-        "logged_in", "username", "api_key", "store", "uploaded_doc_names", 
-        "selected_language", "vectorstore", "full_document_content", "document_chunks"
+        "logged_in", "username", "api_key", "uploaded_doc_names", 
+        "selected_language", "vectorstore", "document_chunks", "recent_sessions",
+        "chat_histories"
     ]
     
     for key in keys_to_reset:
@@ -135,64 +551,112 @@ def logout():
                 st.session_state[key] = False
             elif key in ["username", "api_key"]:
                 st.session_state[key] = ""
-            elif key in ["store", "uploaded_doc_names"]:
-                # Ensure correct default type (list for uploaded_doc_names, dict for store)
-                st.session_state[key] = [] if key == "uploaded_doc_names" else {}
+            elif key == "uploaded_doc_names":
+                st.session_state[key] = []
             elif key == "selected_language":
                 st.session_state[key] = "English" # Default language
             else:
                 del st.session_state[key] # Delete other specific keys
     
-    # Clear message history for all sessions from session state
-    keys_to_delete = [key for key in st.session_state.keys() if key.startswith("messages_")]
-    for key in keys_to_delete:
+    # Clear message history for all sessions from session state, in one pass over the keys
+    for key in [key for key in st.session_state if key.startswith("messages_")]:
         del st.session_state[key]
-    
-    st.cache_resource.clear() # Clear Streamlit's resource cache
+
+    # Drop the user's entries from the in-process chat history caches
+    if username:
+        for key in [key for key in _path_cache if key[0] == username]:
+            del _path_cache[key]
+        _ensured_dirs.discard(os.path.join(CHAT_HISTORY_DIR, username))
+        with _history_lock:
+            for key in [key for key in _history_saved_count if key[0] == username]:
+                _forget_chat_history(*key)
+
+    # Shared resources (embedding model, LLM clients, vector stores) hold no
+    # per-user state and stay cached for other sessions
     st.session_state.page = "introduction" # Redirect to intro page
 
+# Display message lists kept in session state at once; older ones are reloaded from disk
+MAX_DISPLAYED_SESSIONS = 8
+
+def touch_display_session(session_id):
+    """
+    Marks a session's display messages as recently used, and drops the display
+    messages of the least recently used sessions beyond MAX_DISPLAYED_SESSIONS.
+    """
+    recent = st.session_state.recent_sessions
+    recent[session_id] = None
+    recent.move_to_end(session_id)
+    while len(recent) > MAX_DISPLAYED_SESSIONS:
+        stale_session_id, _ = recent.popitem(last=False)
+        st.session_state.pop(f"messages_{stale_session_id}", None)
+        st.session_state.chat_histories.pop(stale_session_id, None) # Fully saved by now
+
 # --- Session State Initialization ---
+# (key, factory) pairs; factories give each session its own mutable defaults
+_DEFAULTS = (
+    ("logged_in", lambda: False),
+    ("username", lambda: None),
+    ("api_key", lambda: ""),
+    ("page", lambda: "introduction"), # Controls which page is displayed
+    ("uploaded_doc_names", list), # Names of documents uploaded by user
+    ("messages", list), # Current session messages (used by chat_message)
+    ("selected_language", lambda: "English"),
+    ("vectorstore", lambda: None), # Stores FAISS vector store
+    ("document_chunks", list), # List of Document objects from text splitting
+    ("recent_sessions", OrderedDict), # Session IDs with display messages loaded, least recent first
+    ("chat_histories", dict), # Session ID -> chat history object this browser session holds
+)
+
 def initialize_session_state():
     """Initializes default values for Streamlit session state variables."""
-    defaults = {
-        "logged_in": False,
-        "username": None,
-        "store": {}, # Used to store ChatMessageHistory objects
-        "api_key": "",
-        "page": "introduction", # Controls which page is displayed
-        "uploaded_doc_names": [], # Names of documents uploaded by user
-        "messages": [], # Current session messages (used by chat_message)
-        "selected_language": "English",
-        "vectorstore": None, # Stores FAISS vector store
-        "full_document_content": "", # Raw text content of uploaded documents
-        "document_chunks": [], # List of Document objects from text splitting
-    }
-    
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+    session_state = st.session_state
+    for key, factory in _DEFAULTS:
+        if key not in session_state:
+            session_state[key] = factory()
 
 # --- Web Search Function ---
+# Recent web search results: normalized query -> (time fetched, result).
+# Kept in least-recently-used order; only non-empty results are stored.
+SEARCH_CACHE_TTL = 600 # seconds
+SEARCH_CACHE_SIZE = 128
+_search_cache: dict[str, tuple[float, dict]] = {}
+_search_cache_lock = threading.Lock()
+
 def perform_web_search(query):
-    """Performs a web search using the googlesearch library."""
-    global GOOGLE_SEARCH_AVAILABLE # Ensure we use the global variable
-    if not GOOGLE_SEARCH_AVAILABLE:
+    """
+    Performs a web search using the googlesearch library. Results are cached
+    for SEARCH_CACHE_TTL seconds by normalized query, so repeated fallbacks for
+    the same question do not hit the network again.
+    """
+    if google_search is None:
         # st.warning("Google search functionality not available. Please install 'googlesearch-python'.")
         return {} # Return empty if functionality is not available
-    
+
+    key = query.strip().lower()
+    with _search_cache_lock:
+        cached = _search_cache.pop(key, None)
+        if cached is not None and time.monotonic() - cached[0] < SEARCH_CACHE_TTL:
+            _search_cache[key] = cached # Re-insert as most recently used
+            return cached[1]
+
     try:
-        # num_results=3 for reasonable performance and breadth
-        search_results = list(google_search(query, num_results=3, lang='en'))
-        if search_results:
-            # Return the first result as a representative snippet
-            return {
-                "title": "Web Search Results", # Placeholder title
-                "snippet": f"Found {len(search_results)} results for your query. Top result: {search_results[0]}",
-                "url": search_results[0] if search_results else "#" # Link to the top result
-            }
-        else:
+        # Only the top result is shown, so stop reading results after the first
+        top_result = next(islice(google_search(query, num_results=3, lang='en'), 1), None)
+        if top_result is None:
             return {} # No results found
+        # Return the first result as a representative snippet
+        result = {
+            "title": "Web Search Results", # Placeholder title
+            "snippet": f"Top result: {top_result}",
+            "url": top_result # Link to the top result
+        }
     except Exception as e:
         # Log error to console for debugging, don't use st.error in utility
         print(f"Error during web search: {e}")
         return {}
+
+    with _search_cache_lock:
+        _search_cache[key] = (time.monotonic(), result)
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            del _search_cache[next(iter(_search_cache))] # Evict least recently used
+    return result